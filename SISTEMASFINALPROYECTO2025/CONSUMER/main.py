@@ -1,4 +1,5 @@
 import csv
+import fcntl
 import functools
 import json
 import logging
@@ -16,6 +17,7 @@ import pika
 # CONFIGURACIÓN DE PERSISTENCIA MEJORADA
 DATA_DIR = Path("/code/app/data")
 JSON_FILE = DATA_DIR / "claims.json"
+LOCK_FILE = DATA_DIR / "claims.json.lock"  # Compartido con el archiver y el reader
 BACKUP_DIR = DATA_DIR / "backups"
 
 # Crear directorios necesarios
@@ -54,7 +56,11 @@ def ack_message(channel, delivery_tag):
 def write_to_json(filename, message: dict, tlock: threading.Lock):
     """Write to a JSON collection file with improved persistence"""
     tlock.acquire()
+    lock = None
     try:
+        lock = open(LOCK_FILE, "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        
         # BACKUP antes de modificar (cada 10 registros)
         if os.path.exists(filename):
             with open(filename, "r") as f:
@@ -84,9 +90,11 @@ def write_to_json(filename, message: dict, tlock: threading.Lock):
             }
         
         # Añadir nuevo registro con timestamp y index
+        # (los claims ya archivados siguen contando para que el index no se repita)
         new_entry = {
-            "index": len(data["claims"]),
+            "index": data["metadata"].get("archived_records", 0) + len(data["claims"]),
             "timestamp": datetime.now().isoformat(),
+            "version": 0,  # Se incrementa con cada cambio de status
             **message
         }
         data["claims"].append(new_entry)
@@ -112,6 +120,8 @@ def write_to_json(filename, message: dict, tlock: threading.Lock):
         with open(emergency_file, "w") as f:
             json.dump({"error_message": message, "timestamp": datetime.now().isoformat()}, f)
     finally:
+        if lock is not None:
+            lock.close()  # Cerrar el archivo libera el flock
         tlock.release()
 
 def do_work(channel, delivery_tag, body, tlock: threading.Lock):
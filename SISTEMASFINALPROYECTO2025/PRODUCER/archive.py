@@ -0,0 +1,284 @@
+"""Compaction of old claims into compressed, time-partitioned archive segments.
+
+Claims idle for more than ARCHIVE_MAX_AGE_DAYS (by last_modified, else
+timestamp), or in one of the opt-in ARCHIVE_TERMINAL_STATUSES, are moved out of
+the hot claims.json into gzip segments (one per month of the claim timestamp).
+An index maps each claim id to the segments that hold it so readers can fall
+back to the archive without scanning every segment. Each segment has a
+companion history file with the status history of its claims, taken out of
+the hot status_history.jsonl. A status change on an archived claim brings it
+and its history back to the hot files (restore_archived_claim).
+
+Usage: python archive.py [--interval SECONDS]
+"""
+import argparse
+import fcntl
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from history import committed_entries, history_key, status_log
+
+# CONFIGURACIÓN DEL ARCHIVO
+DATA_DIR = Path("/code/app/data")
+JSON_FILE = DATA_DIR / "claims.json"
+LOCK_FILE = DATA_DIR / "claims.json.lock"
+ARCHIVE_DIR = DATA_DIR / "archive"
+INDEX_FILE = ARCHIVE_DIR / "index.json"
+
+MAX_AGE_DAYS = float(os.environ.get("ARCHIVE_MAX_AGE_DAYS", "30"))
+SEGMENT_CACHE_SIZE = int(os.environ.get("ARCHIVE_SEGMENT_CACHE_SIZE", "8"))
+TERMINAL_STATUSES = {
+    s.strip() for s in os.environ.get("ARCHIVE_TERMINAL_STATUSES", "").split(",")
+    if s.strip()
+}
+
+
+@contextmanager
+def claims_file_lock():
+    """Inter-process lock shared by every writer of claims.json"""
+    DATA_DIR.mkdir(exist_ok=True, parents=True)
+    with open(LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _write_atomic(path: Path, payload: bytes):
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "wb") as f:
+        f.write(payload)
+    os.replace(temp_file, path)
+
+
+def _segment_name(claim: dict) -> str:
+    # Particionado por mes del timestamp del claim
+    timestamp = claim.get("timestamp") or ""
+    return f"claims-{timestamp[:7] or 'sin-fecha'}.json.gz"
+
+
+def _is_archivable(claim: dict, cutoff: str) -> bool:
+    if claim.get("status") in TERMINAL_STATUSES:
+        return True
+    # La edad se mide desde la última actividad, no desde la creación
+    last_active = claim.get("last_modified") or claim.get("timestamp")
+    return bool(last_active) and last_active < cutoff
+
+
+def read_segment(name: str) -> list:
+    path = ARCHIVE_DIR / name
+    if not path.exists():
+        return []
+    with gzip.open(path, "rb") as f:
+        return json.load(f)
+
+
+def _history_name(name: str) -> str:
+    return name.replace(".json.gz", ".history.json.gz")
+
+
+def read_segment_history(name: str) -> dict:
+    path = ARCHIVE_DIR / _history_name(name)
+    if not path.exists():
+        return {}
+    with gzip.open(path, "rb") as f:
+        return json.load(f)
+
+
+def read_index() -> dict:
+    if not INDEX_FILE.exists():
+        return {}
+    with open(INDEX_FILE, "r") as f:
+        return json.load(f)
+
+
+# Caché de lecturas: el índice y los segmentos solo se vuelven a parsear si cambia su mtime
+_index_cache = (None, {})
+_index_cache_lock = threading.Lock()
+
+
+def _cached_index() -> dict:
+    global _index_cache
+    try:
+        mtime = INDEX_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    with _index_cache_lock:
+        if _index_cache[0] != mtime:
+            _index_cache = (mtime, read_index())
+        return _index_cache[1]
+
+
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def _segment_claims_by_id(name: str, mtime: int) -> dict:
+    claims_by_id = {}
+    for claim in read_segment(name):
+        claims_by_id.setdefault(claim.get("id"), claim)
+    return claims_by_id
+
+
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def _segment_history(name: str, mtime: int) -> dict:
+    return read_segment_history(name)
+
+
+def read_archived_history(claim: dict) -> list:
+    """Return the status history of an archived claim, oldest first"""
+    name = _segment_name(claim)
+    try:
+        mtime = (ARCHIVE_DIR / _history_name(name)).stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+    return _segment_history(name, mtime).get(str(history_key(claim)), [])
+
+
+def find_archived_claim(claim_id: str):
+    """Return the first archived claim with the given id, or None"""
+    for name in _cached_index().get(claim_id, []):
+        try:
+            mtime = (ARCHIVE_DIR / name).stat().st_mtime_ns
+        except FileNotFoundError:
+            continue
+        claim = _segment_claims_by_id(name, mtime).get(claim_id)
+        if claim is not None:
+            return claim
+    return None
+
+
+def restore_archived_claim(claim_id: str):
+    """Return a copy of an archived claim so it can be modified in the hot file, or None.
+
+    The caller must hold claims_file_lock(), append the claim to claims.json and,
+    once that file is written, call drop_archived_claim().
+    """
+    claim = find_archived_claim(claim_id)
+    if claim is None:
+        return None
+    claim = dict(claim)
+
+    # Su historial vuelve al log caliente junto con el claim
+    status_log.append(read_archived_history(claim))
+    return claim
+
+
+def drop_archived_claim(claim: dict):
+    """Remove a restored claim from its segment and from the index"""
+    name = _segment_name(claim)
+    remaining = [c for c in read_segment(name) if c.get("index") != claim.get("index")]
+    _write_atomic(ARCHIVE_DIR / name, gzip.compress(json.dumps(remaining).encode("utf-8")))
+
+    histories = read_segment_history(name)
+    if histories.pop(str(history_key(claim)), None) is not None:
+        _write_atomic(ARCHIVE_DIR / _history_name(name), gzip.compress(json.dumps(histories).encode("utf-8")))
+
+    index = read_index()
+    if not any(c.get("id") == claim.get("id") for c in remaining):
+        segments = [n for n in index.get(claim.get("id"), []) if n != name]
+        if segments:
+            index[claim.get("id")] = segments
+        else:
+            index.pop(claim.get("id"), None)
+        _write_atomic(INDEX_FILE, json.dumps(index).encode("utf-8"))
+
+
+def compact(now: datetime = None) -> int:
+    """Move archivable claims out of the hot file. Returns the number of claims moved."""
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=MAX_AGE_DAYS)).isoformat()
+
+    with claims_file_lock():
+        if not JSON_FILE.exists():
+            return 0
+
+        with open(JSON_FILE, "r") as f:
+            data = json.load(f)
+
+        hot, by_segment = [], {}
+        for claim in data.get("claims", []):
+            if _is_archivable(claim, cutoff):
+                by_segment.setdefault(_segment_name(claim), []).append(claim)
+            else:
+                hot.append(claim)
+
+        if not by_segment:
+            return 0
+
+        ARCHIVE_DIR.mkdir(exist_ok=True, parents=True)
+        index = read_index()
+        collected = status_log.collect({history_key(c) for claims in by_segment.values() for c in claims})
+
+        # Primero los segmentos y el índice; el archivo caliente se reescribe al final
+        # para que un fallo a mitad de camino no pierda claims
+        for name in sorted(by_segment):
+            claims = by_segment[name]
+            # Un claim restaurado y vuelto a archivar (o un reintento tras un fallo)
+            # reemplaza su copia anterior en el segmento
+            incoming = {claim.get("index") for claim in claims}
+            existing = [c for c in read_segment(name) if c.get("index") not in incoming]
+            _write_atomic(ARCHIVE_DIR / name, gzip.compress(json.dumps(existing + claims).encode("utf-8")))
+
+            # El historial de estos claims pasa del log caliente al historial del segmento
+            histories = read_segment_history(name)
+            for claim in claims:
+                key = history_key(claim)
+                entries = committed_entries(histories.get(str(key), []) + collected.get(key, []), claim.get("version", 0))
+                if entries:
+                    histories[str(key)] = entries
+            _write_atomic(ARCHIVE_DIR / _history_name(name), gzip.compress(json.dumps(histories).encode("utf-8")))
+            for claim in claims:
+                segments = index.setdefault(claim.get("id"), [])
+                if name not in segments:
+                    segments.append(name)
+                    segments.sort()
+        _write_atomic(INDEX_FILE, json.dumps(index).encode("utf-8"))
+
+        moved = sum(len(claims) for claims in by_segment.values())
+        data["claims"] = hot
+        data["metadata"]["total_records"] = len(hot)
+        data["metadata"]["archived_records"] = data["metadata"].get("archived_records", 0) + moved
+        data["metadata"]["last_compacted"] = now.isoformat()
+        _write_atomic(JSON_FILE, json.dumps(data, indent=2).encode("utf-8"))
+
+        # Por último, el log caliente se queda solo con el historial de los claims calientes
+        status_log.retain({history_key(c) for c in hot})
+
+    logging.info(f"Archived {moved} claims into {len(by_segment)} segments")
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old claims into archive segments")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="Run every INTERVAL seconds instead of once")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            compact()
+        except Exception as e:
+            logging.error(f"Compaction failed: {e}")
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=20,
+        format="%(asctime)s [%(levelname)s] %(funcName)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    logging.info(f"Starting archiver...")
+
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Microbenchmark: per-claim CPU cost of the PayloadModel and claims-list paths.
+
+Usage: python bench_payload.py [n_claims]
+"""
+import json
+import pickle
+import sys
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+
+from pyd_models import PayloadModel, validate_payload_fast
+
+
+def per_claim_us(fn, items):
+    start = time.process_time()
+    for item in items:
+        fn(item)
+    return (time.process_time() - start) / len(items) * 1e6
+
+
+def ingest_before(raw):
+    payload = PayloadModel(**raw)
+    return pickle.dumps(payload.dict())
+
+
+def ingest_after(raw):
+    return validate_payload_fast(raw).to_wire()
+
+
+def list_before(response):
+    return json.dumps(jsonable_encoder(response)).encode("utf-8")
+
+
+def list_after(response):
+    return ORJSONResponse(response).body
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    raws = [
+        {"id": str(i), "customer": "John Doe", "amount": 500, "description": "Car damage claim"}
+        for i in range(n)
+    ]
+
+    # Comprobar que ambos caminos producen el mismo mensaje
+    assert pickle.loads(ingest_before(raws[0])) == pickle.loads(ingest_after(raws[0]))
+
+    before = per_claim_us(ingest_before, raws)
+    after = per_claim_us(ingest_after, raws)
+    print(f"ingest  validate+serialize: {before:8.2f} us/claim -> {after:8.2f} us/claim")
+
+    claims = [{"index": i, "timestamp": "2025-05-23T02:41:58.632623", **raw} for i, raw in enumerate(raws)]
+    response = {"claims": claims, "total": n}
+    assert orjson.loads(list_before(response)) == orjson.loads(list_after(response))
+
+    before = per_claim_us(list_before, [response]) / n
+    after = per_claim_us(list_after, [response]) / n
+    print(f"reader  claims list JSON:   {before:8.2f} us/claim -> {after:8.2f} us/claim")
+
+
+if __name__ == "__main__":
+    main()
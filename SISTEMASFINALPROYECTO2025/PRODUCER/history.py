@@ -0,0 +1,170 @@
+"""Append-only status history log, kept apart from claims.json.
+
+Each status change is one JSON line, keyed by the claim's consumer-assigned
+index (claim ids come from clients and are not unique). Readers keep an
+in-memory index of byte offsets per claim, refreshed incrementally from the
+last scanned position, so a page of history is read with a few seeks instead
+of a full-file parse. The log only holds history for claims in the hot file:
+archive.compact() moves the entries of archived claims into per-segment
+history files and rewrites the log, so it stays bounded like claims.json.
+Appends and rewrites must happen while holding archive.claims_file_lock().
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Set
+
+DATA_DIR = Path("/code/app/data")
+HISTORY_FILE = DATA_DIR / "status_history.jsonl"
+
+
+def history_key(claim: dict) -> int:
+    return claim["index"]
+
+
+class StatusHistoryLog:
+    def __init__(self, path: Path):
+        self.path = path
+        self._reset(None)
+        self._lock = threading.Lock()
+
+    def _reset(self, inode):
+        self._inode = inode
+        self._offsets = {}
+        self._versions = {}
+        self._scanned = 0
+
+    def append(self, entries: List[dict]):
+        # Una sola escritura para todas las entradas del mismo cambio
+        with open(self.path, "ab") as f:
+            f.write(b"".join(json.dumps(entry).encode("utf-8") + b"\n" for entry in entries))
+
+    def _refresh(self, f):
+        stat = os.fstat(f.fileno())
+        if stat.st_ino != self._inode or stat.st_size < self._scanned:
+            # El log fue reescrito por la compactación: reconstruir el índice
+            self._reset(stat.st_ino)
+
+        f.seek(self._scanned)
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                # Línea incompleta (escritura en curso); se indexa en la próxima lectura
+                break
+            entry = json.loads(line)
+            offsets = self._offsets.setdefault(entry["claim_index"], [])
+            versions = self._versions.setdefault(entry["claim_index"], [])
+            if entry["version"] in versions:
+                # Entrada huérfana de un cambio que no llegó a claims.json: gana la última
+                offsets[versions.index(entry["version"])] = offset
+            else:
+                offsets.append(offset)
+                versions.append(entry["version"])
+            self._scanned = f.tell()
+
+    def _read_page(self, f, key: int, offset: int, limit: int, max_version: int):
+        self._refresh(f)
+        offsets = self._offsets.get(key, [])
+        versions = self._versions.get(key, [])
+        total = len(offsets)
+        if max_version is not None:
+            while total and versions[total - 1] > max_version:
+                total -= 1
+        offsets = offsets[:total]
+
+        page = offsets[offset:] if limit is None else offsets[offset:offset + limit]
+        entries = []
+        for position in page:
+            f.seek(position)
+            entries.append(json.loads(f.readline()))
+        return total, entries
+
+    def read(self, key: int, offset: int = 0, limit: int = None, max_version: int = None):
+        """Return (total, entries) for one page of a claim's history, oldest first.
+
+        Entries above max_version (written but never committed to claims.json) are skipped.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0, []
+
+        # Índice y lectura sobre el mismo descriptor, para no mezclar con un log reescrito
+        with f, self._lock:
+            total, entries = self._read_page(f, key, offset, limit, max_version)
+            if any(entry["claim_index"] != key for entry in entries):
+                # Inodo reutilizado tras una reescritura: reconstruir y repetir
+                self._reset(None)
+                total, entries = self._read_page(f, key, offset, limit, max_version)
+        return total, entries
+
+    def collect(self, keys: Set[int]) -> Dict[int, List[dict]]:
+        """Return every entry of the given claims, grouped by claim"""
+        collected = {}
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        entry = json.loads(line)
+                        if entry["claim_index"] in keys:
+                            collected.setdefault(entry["claim_index"], []).append(entry)
+        return collected
+
+    def retain(self, keys: Set[int]):
+        """Rewrite the log keeping only the entries of the given claims"""
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            kept = [line for line in f if line.endswith(b"\n") and json.loads(line)["claim_index"] in keys]
+        temp_file = f"{self.path}.tmp"
+        with open(temp_file, "wb") as f:
+            f.write(b"".join(kept))
+        os.replace(temp_file, self.path)
+
+
+status_log = StatusHistoryLog(HISTORY_FILE)
+
+
+def legacy_entries(claim: dict) -> List[dict]:
+    """Convert a claim's embedded status_history (previous format) to log entries"""
+    legacy = claim.get("status_history", [])
+    return [
+        {
+            "claim_index": history_key(claim),
+            "claim_id": claim["id"],
+            "version": i + 1,
+            "previous_status": item.get("previous_status"),
+            "new_status": legacy[i + 1].get("previous_status") if i + 1 < len(legacy) else claim.get("status"),
+            "changed_at": item.get("changed_at")
+        }
+        for i, item in enumerate(legacy)
+    ]
+
+
+def apply_status_change(claim: dict, new_status: str, changed_at: str) -> List[dict]:
+    """Update status and version in place and return the entries to append to the log"""
+    # Migrar el historial embebido al log
+    entries = legacy_entries(claim)
+    claim.pop("status_history", None)
+
+    version = claim.get("version", len(entries)) + 1
+    entries.append({
+        "claim_index": history_key(claim),
+        "claim_id": claim["id"],
+        "version": version,
+        "previous_status": claim.get("status", "Unknown"),
+        "new_status": new_status,
+        "changed_at": changed_at
+    })
+
+    claim["status"] = new_status
+    claim["version"] = version
+    return entries
+
+
+def committed_entries(entries: List[dict], max_version: int) -> List[dict]:
+    """Keep the last entry per version, up to the claim's committed version"""
+    by_version = {entry["version"]: entry for entry in entries}
+    return [by_version[v] for v in sorted(by_version) if v <= max_version]
@@ -1,14 +1,17 @@
 import logging
 import os
-import pickle
 import sys
 from pathlib import Path
 import json
+from datetime import datetime
 
 import pika
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 
-from pyd_models import PayloadModel
+from archive import claims_file_lock, drop_archived_claim, find_archived_claim, restore_archived_claim
+from history import apply_status_change, status_log
+from pyd_models import PayloadModel, PayloadValidationError, validate_payload_fast
 
 import threading
 from pydantic import BaseModel
@@ -39,17 +42,35 @@ async def logging_init():
 def read_root():
     return {"Developer": "Adib Yahaya"}
 
-@app.post("/api")
-def accept_payload(payload: PayloadModel):
-    payload_dict = payload.dict()
-    logging.debug(f"Payload received: {payload_dict}")
-
+def publish_payload(body: bytes):
     with pika.BlockingConnection(rabbit_params) as connection:
         channel = connection.channel()
         channel.queue_declare(queue=QUEUE_NAME)
         channel.basic_publish(exchange="", 
                             routing_key=QUEUE_NAME, 
-                            body=pickle.dumps(payload_dict))
+                            body=body)
+
+# El body se lee a mano, así que el esquema de PayloadModel se declara para /docs
+@app.post("/api", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": PayloadModel.schema()}}
+    }
+})
+async def accept_payload(request: Request):
+    """Validate a claim with the precompiled PayloadModel schema and publish it"""
+    try:
+        payload = validate_payload_fast(json.loads(await request.body()))
+    except PayloadValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    except ValueError:
+        # Cubre JSONDecodeError y UnicodeDecodeError
+        raise HTTPException(status_code=422, detail="Invalid JSON body")
+
+    logging.debug(f"Payload received: {payload.__dict__}")
+
+    # Publicar sin bloquear el event loop
+    await run_in_threadpool(publish_payload, payload.to_wire())
 
     return {"status": "received"}
 
@@ -84,7 +105,14 @@ def get_claim_by_id(claim_id: str):
             if claim.get("id") == claim_id:
                 return claim
         
+        # Si no está en el archivo caliente, buscar en el archivo histórico
+        archived = find_archived_claim(claim_id)
+        if archived is not None:
+            return archived
+        
         raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading claim: {str(e)}")
     
@@ -100,31 +128,46 @@ file_lock = threading.Lock()
 @app.put("/claims/{claim_id}/status")
 def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
     """Update claim status using PUT (complete replacement)"""
-    with file_lock:
+    with file_lock, claims_file_lock():
         if not JSON_FILE.exists():
             raise HTTPException(status_code=404, detail="Claims file not found")
         
         try:
+            changed_at = datetime.now().isoformat()
+            
             # Leer datos existentes
             with open(JSON_FILE, "r") as f:
                 data = json.load(f)
             
             claims = data.get("claims", [])
             claim_found = False
+            history_entries = []
             
             # Buscar y actualizar el claim
             for i, claim in enumerate(claims):
                 if claim.get("id") == claim_id:
-                    claims[i]["status"] = status_update.status
-                    claims[i]["last_modified"] = "2025-05-23T02:43:47.447767"  # Timestamp actual
+                    history_entries = apply_status_change(claims[i], status_update.status, changed_at)
+                    claims[i]["last_modified"] = changed_at
                     claim_found = True
                     break
             
+            restored_claim = None
             if not claim_found:
-                raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                # Un claim archivado vuelve al archivo caliente al cambiar de status
+                restored_claim = restore_archived_claim(claim_id)
+                if restored_claim is None:
+                    raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                claims.append(restored_claim)
+                data["metadata"]["total_records"] = len(claims)
+                history_entries = apply_status_change(restored_claim, status_update.status, changed_at)
+                restored_claim["last_modified"] = changed_at
             
             # Actualizar metadatos
-            data["metadata"]["last_updated"] = "2025-05-23T02:43:47.447767"
+            data["metadata"]["last_updated"] = changed_at
+            
+            # Registrar el cambio en el log antes de reescribir el claim: si falla
+            # aquí no se pierde historial, y una entrada huérfana se reconoce por su version
+            status_log.append(history_entries)
             
             # Escribir de vuelta al archivo (operación atómica)
             temp_file = f"{JSON_FILE}.tmp"
@@ -134,6 +177,10 @@ def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
             # Reemplazar archivo original
             os.replace(temp_file, JSON_FILE)
             
+            # Ya está en el archivo caliente: quitarlo del archivo histórico
+            if restored_claim is not None:
+                drop_archived_claim(restored_claim)
+            
             return {
                 "message": f"Status updated successfully for claim {claim_id}",
                 "id": claim_id,
@@ -141,6 +188,8 @@ def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
                 "operation": "PUT"
             }
             
+        except HTTPException:
+            raise
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Claims file is corrupted")
         except Exception as e:
@@ -149,33 +198,49 @@ def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
 @app.patch("/claims/{claim_id}/status")
 def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
     """Update claim status using PATCH (partial update)"""
-    with file_lock:
+    with file_lock, claims_file_lock():
         if not JSON_FILE.exists():
             raise HTTPException(status_code=404, detail="Claims file not found")
         
         try:
+            changed_at = datetime.now().isoformat()
+            
             # Leer datos existentes
             with open(JSON_FILE, "r") as f:
                 data = json.load(f)
             
             claims = data.get("claims", [])
             claim_found = False
+            history_entries = []
             old_status = None
             
             # Buscar y actualizar el claim
             for i, claim in enumerate(claims):
                 if claim.get("id") == claim_id:
                     old_status = claim.get("status", "Unknown")
-                    claims[i]["status"] = status_update.status
-                    claims[i]["last_modified"] = "2025-05-23T02:43:47.447767"
+                    history_entries = apply_status_change(claims[i], status_update.status, changed_at)
+                    claims[i]["last_modified"] = changed_at
                     claim_found = True
                     break
             
+            restored_claim = None
             if not claim_found:
-                raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                # Un claim archivado vuelve al archivo caliente al cambiar de status
+                restored_claim = restore_archived_claim(claim_id)
+                if restored_claim is None:
+                    raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                claims.append(restored_claim)
+                data["metadata"]["total_records"] = len(claims)
+                old_status = restored_claim.get("status", "Unknown")
+                history_entries = apply_status_change(restored_claim, status_update.status, changed_at)
+                restored_claim["last_modified"] = changed_at
             
             # Actualizar metadatos
-            data["metadata"]["last_updated"] = "2025-05-23T02:43:47.447767"
+            data["metadata"]["last_updated"] = changed_at
+            
+            # Registrar el cambio en el log antes de reescribir el claim: si falla
+            # aquí no se pierde historial, y una entrada huérfana se reconoce por su version
+            status_log.append(history_entries)
             
             # Escribir de vuelta al archivo (operación atómica)
             temp_file = f"{JSON_FILE}.tmp"
@@ -185,6 +250,10 @@ def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
             # Reemplazar archivo original
             os.replace(temp_file, JSON_FILE)
             
+            # Ya está en el archivo caliente: quitarlo del archivo histórico
+            if restored_claim is not None:
+                drop_archived_claim(restored_claim)
+            
             return {
                 "message": f"Status updated successfully for claim {claim_id}",
                 "id": claim_id,
@@ -193,6 +262,8 @@ def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
                 "operation": "PATCH"
             }
             
+        except HTTPException:
+            raise
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Claims file is corrupted")
         except Exception as e:
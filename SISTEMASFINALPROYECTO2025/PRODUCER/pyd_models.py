@@ -1,11 +1,15 @@
 
+import math
+import pickle
 from datetime import datetime
+from decimal import Decimal
 from typing import List
 from datetime import datetime
 from typing import List, Optional
 
 from pydantic import (
     BaseModel,
+    ValidationError,
     validator,
 )
 
@@ -31,4 +35,97 @@ class PayloadModel(BaseModel):
     customer: str
     amount: float
     description: str
-    status: Optional[str] = "Enviado"  # NUEVO CAMPO AÑADIDO con valor por defecto
\ No newline at end of file
+    status: Optional[str] = "Enviado"  # NUEVO CAMPO AÑADIDO con valor por defecto
+
+    def to_wire(self) -> bytes:
+        """Serialize the validated fields straight to the queue codec"""
+        return pickle.dumps(self.__dict__, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# RUTA RÁPIDA - validación precompilada del esquema de PayloadModel
+class PayloadValidationError(ValueError):
+    def __init__(self, errors: List[dict]):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _coerce_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    raise TypeError("str type expected", "type_error.str")
+
+
+def _coerce_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise TypeError("value is not a valid float", "type_error.float")
+    # NaN/Infinity no son JSON válido y romperían la lectura de claims.json
+    if not math.isfinite(value):
+        raise TypeError("value is not a finite number", "value_error.number.not_finite")
+    return value
+
+
+_COERCERS = {str: _coerce_str, float: _coerce_float}
+
+# Se calcula una sola vez al importar: (nombre, coerción, requerido, admite None, default)
+_PAYLOAD_SCHEMA = tuple(
+    (name, _COERCERS.get(field.outer_type_), field.required, field.allow_none, field.default)
+    for name, field in PayloadModel.__fields__.items()
+)
+# Si PayloadModel gana un campo de otro tipo, se valida con pydantic en lugar de fallar
+_FAST_PATH_SUPPORTED = all(coerce is not None for _, coerce, _, _, _ in _PAYLOAD_SCHEMA)
+
+
+def _validate_payload_pydantic(raw) -> PayloadModel:
+    try:
+        return PayloadModel.parse_obj(raw)
+    except ValidationError as e:
+        raise PayloadValidationError(
+            [{**error, "loc": ["body", *error["loc"]]} for error in e.errors()]
+        )
+
+
+def validate_payload_fast(raw) -> PayloadModel:
+    """Validate a decoded claim with the same rules as PayloadModel, skipping pydantic's generic machinery"""
+    if not _FAST_PATH_SUPPORTED:
+        return _validate_payload_pydantic(raw)
+
+    if not isinstance(raw, dict):
+        raise PayloadValidationError(
+            [{"loc": ["body"], "msg": "value is not a valid dict", "type": "type_error.dict"}]
+        )
+
+    values = {}
+    fields_set = set()
+    errors = []
+    for name, coerce, required, allow_none, default in _PAYLOAD_SCHEMA:
+        if name not in raw:
+            if required:
+                errors.append({"loc": ["body", name], "msg": "field required", "type": "value_error.missing"})
+            else:
+                values[name] = default
+            continue
+
+        fields_set.add(name)
+        value = raw[name]
+        if value is None:
+            if allow_none:
+                values[name] = None
+            else:
+                errors.append({"loc": ["body", name], "msg": "none is not an allowed value",
+                               "type": "type_error.none.not_allowed"})
+            continue
+
+        try:
+            values[name] = coerce(value)
+        except TypeError as e:
+            msg, error_type = e.args
+            errors.append({"loc": ["body", name], "msg": msg, "type": error_type})
+
+    if errors:
+        raise PayloadValidationError(errors)
+
+    return PayloadModel.construct(_fields_set=fields_set, **values)
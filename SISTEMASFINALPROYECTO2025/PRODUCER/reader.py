@@ -1,11 +1,22 @@
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 import json
 import os
+from datetime import datetime
 from pathlib import Path
 from typing import Optional, List
 import threading
 from pydantic import BaseModel
 
+from archive import (
+    claims_file_lock,
+    drop_archived_claim,
+    find_archived_claim,
+    read_archived_history,
+    restore_archived_claim,
+)
+from history import apply_status_change, committed_entries, history_key, legacy_entries, status_log
+
 app = FastAPI(title="Claims Reader API")
 
 DATA_DIR = Path("/code/app/data")
@@ -37,7 +48,9 @@ def get_all_claims(
         else:
             claims = claims[offset:]
         
-        return {
+        # Respuesta directa con orjson, sin pasar por jsonable_encoder
+        # (la lectura usa json estándar, que tolera NaN/Infinity de datos antiguos)
+        return ORJSONResponse({
             "claims": claims,
             "total": total,
             "metadata": data.get("metadata", {}),
@@ -46,29 +59,10 @@ def get_all_claims(
                 "offset": offset,
                 "returned": len(claims)
             }
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading claims: {str(e)}")
 
-@app.get("/claims/{claim_id}")
-def get_claim_by_id(claim_id: str):
-    """Get a specific claim by ID"""
-    try:
-        if not JSON_FILE.exists():
-            raise HTTPException(status_code=404, detail="No claims found")
-        
-        with open(JSON_FILE, "r") as f:
-            data = json.load(f)
-        
-        claims = data.get("claims", [])
-        for claim in claims:
-            if claim.get("id") == claim_id:
-                return claim
-        
-        raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Invalid JSON file")
-
 @app.get("/claims/search")
 def search_claims(q: str = Query(..., description="Search term")):
     """Search claims by customer name or description"""
@@ -86,10 +80,31 @@ def search_claims(q: str = Query(..., description="Search term")):
                q.lower() in claim.get("description", "").lower()
         ]
         
-        return {"claims": filtered_claims, "total": len(filtered_claims)}
+        return ORJSONResponse({"claims": filtered_claims, "total": len(filtered_claims)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
+@app.get("/claims/{claim_id}")
+def get_claim_by_id(claim_id: str):
+    """Get a specific claim by ID"""
+    try:
+        claims = []
+        if JSON_FILE.exists():
+            with open(JSON_FILE, "r") as f:
+                claims = json.load(f).get("claims", [])
+        for claim in claims:
+            if claim.get("id") == claim_id:
+                return claim
+        
+        # Si no está en el archivo caliente, buscar en el archivo histórico
+        archived = find_archived_claim(claim_id)
+        if archived is not None:
+            return archived
+        
+        raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=500, detail="Invalid JSON file")
+
 @app.get("/stats")
 def get_stats():
     """Get statistics about the claims data"""
@@ -131,11 +146,13 @@ file_lock = threading.Lock()
 @app.put("/claims/{claim_id}/status")
 def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
     """Update claim status using PUT (complete replacement)"""
-    with file_lock:
+    with file_lock, claims_file_lock():
         if not JSON_FILE.exists():
             raise HTTPException(status_code=404, detail="Claims file not found")
         
         try:
+            changed_at = datetime.now().isoformat()
+            
             # Leer datos existentes
             with open(JSON_FILE, "r") as f:
                 data = json.load(f)
@@ -143,21 +160,35 @@ def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
             claims = data.get("claims", [])
             claim_found = False
             updated_claim = None
+            history_entries = []
             
             # Buscar y actualizar el claim
             for i, claim in enumerate(claims):
                 if claim.get("id") == claim_id:
-                    claims[i]["status"] = status_update.status
-                    claims[i]["last_modified"] = "2025-05-23T02:43:47.447767"
+                    history_entries = apply_status_change(claims[i], status_update.status, changed_at)
+                    claims[i]["last_modified"] = changed_at
                     updated_claim = claims[i]
                     claim_found = True
                     break
             
+            restored_claim = None
             if not claim_found:
-                raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                # Un claim archivado vuelve al archivo caliente al cambiar de status
+                restored_claim = restore_archived_claim(claim_id)
+                if restored_claim is None:
+                    raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                claims.append(restored_claim)
+                data["metadata"]["total_records"] = len(claims)
+                updated_claim = restored_claim
+                history_entries = apply_status_change(restored_claim, status_update.status, changed_at)
+                restored_claim["last_modified"] = changed_at
             
             # Actualizar metadatos
-            data["metadata"]["last_updated"] = "2025-05-23T02:43:47.447767"
+            data["metadata"]["last_updated"] = changed_at
+            
+            # Registrar el cambio en el log antes de reescribir el claim: si falla
+            # aquí no se pierde historial, y una entrada huérfana se reconoce por su version
+            status_log.append(history_entries)
             
             # Escribir de vuelta al archivo (operación atómica)
             temp_file = f"{JSON_FILE}.tmp"
@@ -167,12 +198,18 @@ def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
             # Reemplazar archivo original
             os.replace(temp_file, JSON_FILE)
             
+            # Ya está en el archivo caliente: quitarlo del archivo histórico
+            if restored_claim is not None:
+                drop_archived_claim(restored_claim)
+            
             return {
                 "message": f"Status updated successfully for claim {claim_id}",
                 "claim": updated_claim,
                 "operation": "PUT"
             }
             
+        except HTTPException:
+            raise
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Claims file is corrupted")
         except Exception as e:
@@ -181,11 +218,13 @@ def update_claim_status_put(claim_id: str, status_update: StatusUpdate):
 @app.patch("/claims/{claim_id}/status")
 def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
     """Update claim status using PATCH (partial update)"""
-    with file_lock:
+    with file_lock, claims_file_lock():
         if not JSON_FILE.exists():
             raise HTTPException(status_code=404, detail="Claims file not found")
         
         try:
+            changed_at = datetime.now().isoformat()
+            
             # Leer datos existentes
             with open(JSON_FILE, "r") as f:
                 data = json.load(f)
@@ -193,33 +232,35 @@ def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
             claims = data.get("claims", [])
             claim_found = False
             updated_claim = None
-            status_history = []
+            history_entries = []
             
-            # Buscar y actualizar el claim
+            # Buscar y actualizar el claim (el historial va al log, no al claim)
             for i, claim in enumerate(claims):
                 if claim.get("id") == claim_id:
-                    old_status = claim.get("status", "Unknown")
-                    
-                    # Mantener historial de cambios de status
-                    if "status_history" not in claims[i]:
-                        claims[i]["status_history"] = []
-                    
-                    claims[i]["status_history"].append({
-                        "previous_status": old_status,
-                        "changed_at": "2025-05-23T02:43:47.447767"
-                    })
-                    
-                    claims[i]["status"] = status_update.status
-                    claims[i]["last_modified"] = "2025-05-23T02:43:47.447767"
+                    history_entries = apply_status_change(claims[i], status_update.status, changed_at)
+                    claims[i]["last_modified"] = changed_at
                     updated_claim = claims[i]
                     claim_found = True
                     break
             
+            restored_claim = None
             if not claim_found:
-                raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                # Un claim archivado vuelve al archivo caliente al cambiar de status
+                restored_claim = restore_archived_claim(claim_id)
+                if restored_claim is None:
+                    raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+                claims.append(restored_claim)
+                data["metadata"]["total_records"] = len(claims)
+                updated_claim = restored_claim
+                history_entries = apply_status_change(restored_claim, status_update.status, changed_at)
+                restored_claim["last_modified"] = changed_at
             
             # Actualizar metadatos
-            data["metadata"]["last_updated"] = "2025-05-23T02:43:47.447767"
+            data["metadata"]["last_updated"] = changed_at
+            
+            # Registrar el cambio en el log antes de reescribir el claim: si falla
+            # aquí no se pierde historial, y una entrada huérfana se reconoce por su version
+            status_log.append(history_entries)
             
             # Escribir de vuelta al archivo (operación atómica)
             temp_file = f"{JSON_FILE}.tmp"
@@ -229,6 +270,10 @@ def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
             # Reemplazar archivo original
             os.replace(temp_file, JSON_FILE)
             
+            # Ya está en el archivo caliente: quitarlo del archivo histórico
+            if restored_claim is not None:
+                drop_archived_claim(restored_claim)
+            
             return {
                 "message": f"Status updated successfully for claim {claim_id}",
                 "claim": updated_claim,
@@ -236,6 +281,8 @@ def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
                 "status_changed": True
             }
             
+        except HTTPException:
+            raise
         except json.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Claims file is corrupted")
         except Exception as e:
@@ -243,24 +290,48 @@ def update_claim_status_patch(claim_id: str, status_update: StatusUpdate):
 
 # Endpoint adicional para ver historial de cambios de status
 @app.get("/claims/{claim_id}/status-history")
-def get_claim_status_history(claim_id: str):
-    """Get status change history for a specific claim"""
+def get_claim_status_history(
+    claim_id: str,
+    limit: Optional[int] = Query(None, description="Limit number of results"),
+    offset: Optional[int] = Query(0, description="Offset for pagination")
+):
+    """Get status change history for a specific claim with optional pagination"""
     try:
-        if not JSON_FILE.exists():
-            raise HTTPException(status_code=404, detail="Claims file not found")
-        
-        with open(JSON_FILE, "r") as f:
-            data = json.load(f)
-        
-        claims = data.get("claims", [])
-        for claim in claims:
-            if claim.get("id") == claim_id:
-                return {
-                    "claim_id": claim_id,
-                    "current_status": claim.get("status", "Unknown"),
-                    "status_history": claim.get("status_history", [])
+        claims = []
+        if JSON_FILE.exists():
+            with open(JSON_FILE, "r") as f:
+                claims = json.load(f).get("claims", [])
+        claim = next((c for c in claims if c.get("id") == claim_id), None)
+        archived = claim is None
+        if archived:
+            claim = find_archived_claim(claim_id)
+        if claim is not None:
+            # Claims aún no migrados conservan su historial embebido y no tienen
+            # entradas confirmadas en el log; se sirve en el mismo formato que el log
+            legacy = legacy_entries(claim)
+            version = claim.get("version", len(legacy))
+            if legacy or archived:
+                entries = legacy or committed_entries(read_archived_history(claim), version)
+                total = len(entries)
+                history = entries[offset:] if limit is None else entries[offset:offset + limit]
+            else:
+                total, history = status_log.read(history_key(claim), offset, limit, max_version=version)
+            
+            return {
+                "claim_id": claim_id,
+                "current_status": claim.get("status", "Unknown"),
+                "version": version,
+                "status_history": history,
+                "total": total,
+                "pagination": {
+                    "limit": limit,
+                    "offset": offset,
+                    "returned": len(history)
                 }
+            }
         
         raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading claim history: {str(e)}")
\ No newline at end of file